@@ -5,12 +5,122 @@ Combines the original rule-based chatbot with RAG capabilities using ChromaDB an
 
 import os
 import re
-import random
-from difflib import get_close_matches
+import threading
+from functools import lru_cache
+from itertools import cycle
 from typing import Dict, Any, Optional, Tuple
-import pandas as pd
-from rag_chatbot import RAGChatbot
-from insights import top_insights, customer_insight, recommend_upsell
+from rapidfuzz import process, fuzz
+from config import Config
+from insights import top_insights, customer_insight, recommend_upsell_vec
+
+# Intent keywords, checked in priority order (the first matching intent wins)
+INTENT_KEYWORDS = {
+    "churn": ["churn", "at risk", "likely to cancel", "leaving", "show top churn accounts", "who are at risk"],
+    "high_risk": ["high risk", "very risky", "extreme churn"],
+    "low_risk": ["low risk", "safe customers", "loyal customers", "list low-risk customers"],
+    "high_value": ["high-value", "high value", "top customers", "best customers", "show high-value customers"],
+    "upsell": ["upsell", "cross-sell", "expansion", "growth", "upsell candidates", "suggest upsell"],
+    "segment": ["segment", "group", "distribution", "breakdown", "show customer segments", "show distribution of segments"],
+    "customer": ["tell me about", "info on", "details for", "show customer", "who is"]
+}
+
+DEFAULT_SUGGESTIONS = [
+    "show top churn accounts",
+    "suggest upsell for high-value segment",
+    "show customer segments",
+    "list low-risk customers",
+    "show high-value customers",
+    "tell me about C00001",
+    "who are at risk of churn",
+    "give details for 2",
+    "upsell candidates",
+    "show distribution of segments"
+]
+_SUGGESTIONS_LOWER = [s.lower() for s in DEFAULT_SUGGESTIONS]
+
+# Simple patterns that work well with rule-based responses
+SIMPLE_PATTERNS = [
+    r'(hi|hello|hey)',
+    r'(bye|goodbye)',
+    r'(thank|thanks)',
+    r'show (top|high|low)',
+    r'list (low|high)',
+    r'tell me about \w+',
+    r'give details for \d+',
+    r'upsell candidates',
+    r'show distribution'
+]
+
+
+# Complex patterns that benefit from RAG
+COMPLEX_INDICATORS = [
+    'analyze', 'compare', 'trend', 'pattern', 'insight', 'recommendation',
+    'why', 'how', 'what if', 'explain', 'describe', 'summarize',
+    'relationship', 'correlation', 'impact', 'effect'
+]
+
+def _keyword_pattern(words: list) -> re.Pattern:
+    """Compile a keyword list into a single substring-matching alternation."""
+    return re.compile("|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)))
+
+
+# Precompiled once at import instead of being rebuilt on every query
+_INTENT_PATTERNS = [(intent, _keyword_pattern(words)) for intent, words in INTENT_KEYWORDS.items()]
+_SIMPLE_QUERY_RE = re.compile(r'^(?:' + '|'.join(SIMPLE_PATTERNS) + r')')
+# Zero-width lookahead so overlapping indicators (e.g. "how" inside "show") are all reported
+_COMPLEX_INDICATOR_RE = re.compile(r'(?=(' + '|'.join(re.escape(w) for w in COMPLEX_INDICATORS) + r'))')
+_FOLLOW_UP_RE = re.compile(r"(?:tell me more about|details for|more about|info on)\s+(\d+)")
+_CUSTOMER_RE = re.compile(r'(?:tell me about|info on|details for|show customer|who is)\s+([A-Za-z0-9_ -]+)')
+# Customer ids and counts barely move a query's embedding, so queries containing digits skip the semantic cache
+_HAS_DIGIT_RE = re.compile(r'\d')
+
+
+def _closest_suggestion(phrase: str) -> Optional[str]:
+    """Return the default suggestion closest to the phrase, if any is similar enough."""
+    match = process.extractOne(phrase, _SUGGESTIONS_LOWER, scorer=fuzz.ratio, score_cutoff=60)
+    return DEFAULT_SUGGESTIONS[match[2]] if match else None
+
+
+def _word_pattern(words: list) -> re.Pattern:
+    """Compile a word list into a single whole-word alternation."""
+    return re.compile(r"\b(?:" + "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True)) + r")\b")
+
+
+def _load_df(path: str):
+    """Load the processed customers through the same parquet/CSV path the server uses."""
+    # Imported lazily so importing this module stays cheap
+    from customer_data import read_processed
+    return read_processed(path)
+
+
+def _upper_key_arrays(df) -> tuple:
+    """Return (customer_id as str, upper-cased customer_id, upper-cased company_name) as arrays."""
+    cid_str = df['customer_id'].astype(str)
+    return cid_str.to_numpy(), cid_str.str.upper().to_numpy(), df['company_name'].str.upper().to_numpy()
+
+
+# Single-slot cache so the legacy shim upper-cases the server's DataFrame only once
+_legacy_keys = (None, None)
+
+
+def _legacy_upper_keys(df) -> tuple:
+    global _legacy_keys
+    if _legacy_keys[0] is not df:
+        _legacy_keys = (df, _upper_key_arrays(df))
+    return _legacy_keys[1]
+
+
+@lru_cache(maxsize=4096)
+def classify_intent(phrase: str) -> Optional[str]:
+    """
+    Return the highest-priority intent whose keywords appear in the phrase.
+    Expects the lower-cased, stripped query; cached because UIs resend the same queries.
+    """
+    for intent, pattern in _INTENT_PATTERNS:
+        if pattern.search(phrase):
+            return intent
+    return None
+
 
 class EnhancedChatbot:
     def __init__(self, 
@@ -31,15 +141,22 @@ class EnhancedChatbot:
         self.rag_threshold = rag_threshold
         
         # Load data for rule-based responses
-        self.df = pd.read_csv(data_file_path)
+        self.df = _load_df(data_file_path)
+        self._build_row_index()
+        self._precompute_views()
         
         # Initialize RAG chatbot if enabled
         if self.use_rag:
             try:
+                # Deferred: pulls in ChromaDB, sentence-transformers and Gemini
+                from rag_chatbot import RAGChatbot, SemanticCache
                 self.rag_chatbot = RAGChatbot(
                     gemini_api_key=gemini_api_key,
-                    data_file_path=data_file_path
+                    data_file_path=data_file_path,
+                    chroma_db_path=Config.CHROMA_DB_PATH,
+                    collection_name=Config.COLLECTION_NAME
                 )
+                self._sem_cache = SemanticCache()
                 print("✅ RAG chatbot initialized successfully")
             except Exception as e:
                 print(f"⚠️ Failed to initialize RAG chatbot: {e}")
@@ -52,30 +169,58 @@ class EnhancedChatbot:
         self.GREETINGS = ["hi", "hello", "hey", "good morning", "good afternoon", "good evening"]
         self.BYES = ["bye", "goodbye", "see ya", "talk later", "see you"]
         self.THANKS = ["thank you", "thanks", "thx", "thankyou"]
-        
-        self.DEFAULT_SUGGESTIONS = [
-            "show top churn accounts",
-            "suggest upsell for high-value segment",
-            "show customer segments",
-            "list low-risk customers",
-            "show high-value customers",
-            "tell me about C00001",
-            "who are at risk of churn",
-            "give details for 2",
-            "upsell candidates",
-            "show distribution of segments"
-        ]
+        self._greetings_re = _word_pattern(self.GREETINGS)
+        self._byes_re = _word_pattern(self.BYES)
+        self._thanks_re = _word_pattern(self.THANKS)
+        
+        # Replies rotate in order rather than being drawn at random
+        self._greeting_replies = cycle([
+            "Hello! 👋 I'm your AI-powered CRM assistant. I can help you with customer insights, churn analysis, and business recommendations. How can I assist you today?",
+            "Hi there! 🤖 I have access to your customer data and can provide detailed insights. What would you like to know about your customers?"
+        ])
+        self._thanks_replies = cycle([
+            "You're welcome! 😊 I'm here whenever you need CRM insights.",
+            "Happy to help! Feel free to ask me anything about your customer data."
+        ])
+        self._bye_replies = cycle([
+            "Goodbye! 👋 Thanks for using the CRM assistant!",
+            "See you later! 🎯 Keep those customer insights flowing!"
+        ])
+        
+        self.DEFAULT_SUGGESTIONS = DEFAULT_SUGGESTIONS
+    
+    def _build_row_index(self):
+        """Map customer ids and company names to row positions for O(1) lookups."""
+        cid_str, self._cid_upper, self._name_upper = _upper_key_arrays(self.df)
+        self._row_by_id = {}
+        self._row_by_key = {}
+        for i, (cid, cid_up, name_up) in enumerate(zip(cid_str, self._cid_upper, self._name_upper)):
+            self._row_by_id.setdefault(cid, i)
+            self._row_by_key.setdefault(cid_up, i)
+            if isinstance(name_up, str):
+                self._row_by_key.setdefault(name_up, i)
     
-    def _is_contained_any(self, phrase: str, words: list) -> bool:
-        """Check if any word from the list appears as a whole word in the phrase."""
-        for w in words:
-            pattern = r"\b" + re.escape(w) + r"\b"
-            if re.search(pattern, phrase):
-                return True
-        return False
+    def _precompute_views(self):
+        """Materialize the static result sets used by the rule-based intents once at load time."""
+        df = self.df
+        self._top_churn_view = self._format_list_for_context(top_insights(df, n=10))
+        self._low_risk_top = df[df['churn_prob'] < 0.2].nsmallest(10, 'churn_prob')
+        self._high_value_top = df[df['segment'] == 'high_value'].nlargest(10, 'purchase_history')
+        self._segment_dist = df['segment'].value_counts().to_dict()
+        
+        recs = recommend_upsell_vec(df)
+        cand_df = df.loc[recs.notna()].head(10)
+        self._upsell_cands = [
+            {"id": cid, "company": cname, "rec": rec}
+            for cid, cname, rec in zip(cand_df['customer_id'], cand_df['company_name'], recs[cand_df.index])
+        ]
     
-    def _format_list_for_context(self, results: list) -> Tuple[str, list]:
-        """Format results for context storage."""
+    def _format_list_for_context(self, results: list) -> Tuple[str, tuple]:
+        """
+        Format results for display and context storage.
+        The context list is a tuple of (rank, id, company, insight) tuples: immutable, so it
+        can be shared across requests, and compact when the context is serialized.
+        """
         structured = []
         lines = []
         for i, r in enumerate(results, start=1):
@@ -84,167 +229,117 @@ class EnhancedChatbot:
             prob = float(r.get('churn_prob', 0))
             insight = r.get('insight', '')
             lines.append(f"{i}. {cname} (ID {cid}) — churn {prob:.0%}")
-            structured.append({"rank": i, "id": cid, "company": cname, "insight": insight})
-        return "\n".join(lines), structured
+            structured.append((i, cid, cname, insight))
+        return "\n".join(lines), tuple(structured)
     
-    def _detect_query_complexity(self, query: str) -> float:
+    def _detect_query_complexity(self, q: str) -> float:
         """
         Detect query complexity to decide between RAG and rule-based responses.
+        Expects the lower-cased, stripped query.
         Returns a score between 0 and 1, where 1 indicates high complexity.
         """
-        q = query.lower().strip()
-        
-        # Simple patterns that work well with rule-based responses
-        simple_patterns = [
-            r'^(hi|hello|hey)',
-            r'^(bye|goodbye)',
-            r'^(thank|thanks)',
-            r'^show (top|high|low)',
-            r'^list (low|high)',
-            r'^tell me about \w+',
-            r'^give details for \d+',
-            r'^upsell candidates',
-            r'^show distribution'
-        ]
-        
         # Check for simple patterns
-        for pattern in simple_patterns:
-            if re.match(pattern, q):
-                return 0.2  # Low complexity
-        
-        # Complex patterns that benefit from RAG
-        complex_indicators = [
-            'analyze', 'compare', 'trend', 'pattern', 'insight', 'recommendation',
-            'why', 'how', 'what if', 'explain', 'describe', 'summarize',
-            'relationship', 'correlation', 'impact', 'effect'
-        ]
+        if _SIMPLE_QUERY_RE.match(q):
+            return 0.2  # Low complexity
         
         complexity_score = 0.5  # Base complexity
         
-        for indicator in complex_indicators:
-            if indicator in q:
-                complexity_score += 0.1
+        # One pass over the query collects every complex indicator it contains
+        found = {m.group(1) for m in _COMPLEX_INDICATOR_RE.finditer(q)}
+        complexity_score += 0.1 * len(found)
         
         # Check for multiple conditions or questions
-        if '?' in query or ' and ' in q or ' or ' in q:
+        if '?' in q or ' and ' in q or ' or ' in q:
             complexity_score += 0.2
         
         return min(complexity_score, 1.0)
     
-    def _handle_social_interactions(self, query: str) -> Optional[str]:
+    def _handle_social_interactions(self, q: str) -> Optional[str]:
         """Handle social interactions like greetings, thanks, and goodbyes."""
-        q = query.lower().strip()
-        
-        if self._is_contained_any(q, self.GREETINGS):
-            return random.choice([
-                "Hello! 👋 I'm your AI-powered CRM assistant. I can help you with customer insights, churn analysis, and business recommendations. How can I assist you today?",
-                "Hi there! 🤖 I have access to your customer data and can provide detailed insights. What would you like to know about your customers?"
-            ])
+        if self._greetings_re.search(q):
+            return next(self._greeting_replies)
         
-        if self._is_contained_any(q, self.THANKS):
-            return random.choice([
-                "You're welcome! 😊 I'm here whenever you need CRM insights.",
-                "Happy to help! Feel free to ask me anything about your customer data."
-            ])
+        if self._thanks_re.search(q):
+            return next(self._thanks_replies)
         
-        if self._is_contained_any(q, self.BYES):
-            return random.choice([
-                "Goodbye! 👋 Thanks for using the CRM assistant!",
-                "See you later! 🎯 Keep those customer insights flowing!"
-            ])
+        if self._byes_re.search(q):
+            return next(self._bye_replies)
         
         return None
     
-    def _handle_follow_up_requests(self, query: str, context: dict) -> Optional[str]:
+    def _handle_follow_up_requests(self, q: str, context: dict) -> Optional[str]:
         """Handle follow-up requests for more details."""
-        m = re.search(r"(?:tell me more about|details for|more about|info on)\s+(\d+)", query.lower())
+        m = _FOLLOW_UP_RE.search(q)
         if m and context.get('last_list'):
             idx = int(m.group(1))
-            for it in context['last_list']:
-                if it['rank'] == idx:
-                    row = self.df[self.df['customer_id'].astype(str) == str(it['id'])]
-                    if row.empty:
-                        return f"I couldn't load full details for item {idx} (ID {it['id']})."
-                    text = customer_insight(row.iloc[0])
+            for rank, cid, _, _ in context['last_list']:
+                if rank == idx:
+                    pos = self._row_by_id.get(str(cid))
+                    if pos is None:
+                        return f"I couldn't load full details for item {idx} (ID {cid})."
+                    text = customer_insight(self.df.iloc[pos])
                     return text
-            return f"I don't have item {idx} in the last list. Try one of these: {', '.join(str(x['rank']) for x in context['last_list'])}"
+            return f"I don't have item {idx} in the last list. Try one of these: {', '.join(str(x[0]) for x in context['last_list'])}"
         return None
     
-    def _handle_rule_based_intents(self, query: str, context: dict) -> Optional[str]:
+    def _handle_rule_based_intents(self, q: str, context: dict) -> Optional[str]:
         """Handle specific intents using rule-based logic."""
-        q = query.lower().strip()
-        
         # Intent detection
-        intents = {
-            "churn": ["churn", "at risk", "likely to cancel", "leaving", "show top churn accounts", "who are at risk"],
-            "high_risk": ["high risk", "very risky", "extreme churn"],
-            "low_risk": ["low risk", "safe customers", "loyal customers", "list low-risk customers"],
-            "high_value": ["high-value", "high value", "top customers", "best customers", "show high-value customers"],
-            "upsell": ["upsell", "cross-sell", "expansion", "growth", "upsell candidates", "suggest upsell"],
-            "segment": ["segment", "group", "distribution", "breakdown", "show customer segments", "show distribution of segments"],
-            "customer": ["tell me about", "info on", "details for", "show customer", "who is"]
-        }
-        
-        def match_intent(phrase):
-            for intent, words in intents.items():
-                if any(w in phrase for w in words):
-                    return intent
-            return None
-        
-        intent = match_intent(q)
+        intent = classify_intent(q)
         
         # Handle specific intents
         if intent in ['churn', 'high_risk']:
-            results = top_insights(self.df, n=10)
-            display, structured = self._format_list_for_context(results)
+            display, structured = self._top_churn_view
             context['last_list'] = structured
             return "🚨 Churn or High-risk customers:\n" + display + "\n\nYou can say 'give details for 2' to get more info."
         
         if intent == 'low_risk':
-            rows = self.df[self.df['churn_prob'] < 0.2].sort_values('churn_prob').head(10)
+            rows = self._low_risk_top
             if rows.empty:
                 return "No low-risk customers found."
-            lines = [f"{i+1}. {r['company_name']} (ID {r['customer_id']}) — churn {r['churn_prob']:.0%}" for i, r in rows.iterrows()]
-            structured = [{"rank": i+1, "id": r['customer_id'], "company": r['company_name'], "insight": ''} for i, r in rows.iterrows()]
-            context['last_list'] = structured
+            lines = []
+            structured = []
+            cols = ['company_name', 'customer_id', 'churn_prob']
+            for i, (name, cid, prob) in enumerate(rows[cols].itertuples(index=False, name=None), start=1):
+                lines.append(f"{i}. {name} (ID {cid}) — churn {prob:.0%}")
+                structured.append((i, cid, name, ''))
+            context['last_list'] = tuple(structured)
             return "✅ Low-risk customers:\n" + "\n".join(lines)
         
         if intent == 'high_value':
-            rows = self.df[self.df['segment'] == 'high_value'].sort_values('purchase_history', ascending=False).head(10)
+            rows = self._high_value_top
             if rows.empty:
                 return "No high-value customers found."
-            lines = [f"{i+1}. {r['company_name']} (ID {r['customer_id']}) — spent ${r['purchase_history']:,}" for i, r in rows.iterrows()]
+            lines = []
             structured = []
-            for i, r in enumerate(rows.itertuples(), start=1):
-                structured.append({"rank": i, "id": getattr(r, 'customer_id'), "company": getattr(r, 'company_name'), "insight": ''})
-            context['last_list'] = structured
+            cols = ['company_name', 'customer_id', 'purchase_history']
+            for i, (name, cid, spent) in enumerate(rows[cols].itertuples(index=False, name=None), start=1):
+                lines.append(f"{i}. {name} (ID {cid}) — spent ${spent:,}")
+                structured.append((i, cid, name, ''))
+            context['last_list'] = tuple(structured)
             return "🏆 High-value customers:\n" + "\n".join(lines)
         
         if intent == 'upsell':
-            cand = []
-            for _, r in self.df.iterrows():
-                rec = recommend_upsell(r)
-                if rec:
-                    cand.append({"id": r.get('customer_id'), "company": r.get('company_name'), "rec": rec})
+            cand = self._upsell_cands
             if not cand:
                 return "No immediate upsell candidates found by the rule."
-            lines = [f"{i+1}. {c['company']} (ID {c['id']}) — {c['rec']}" for i, c in enumerate(cand[:10])]
-            context['last_list'] = [{"rank": i+1, "id": c['id'], "company": c['company'], "insight": c['rec']} for i, c in enumerate(cand[:10])]
+            lines = [f"{i+1}. {c['company']} (ID {c['id']}) — {c['rec']}" for i, c in enumerate(cand)]
+            context['last_list'] = tuple((i+1, c['id'], c['company'], c['rec']) for i, c in enumerate(cand))
             return "💡 Upsell candidates:\n" + "\n".join(lines)
         
         if intent == 'segment':
-            dist = self.df['segment'].value_counts().to_dict()
+            dist = self._segment_dist
             context.pop('last_list', None)
             return f"📊 Segment distribution:\n{dist}"
         
         if intent == 'customer':
-            m = re.search(r'(?:tell me about|info on|details for|show customer|who is)\s+([A-Za-z0-9_ -]+)', q)
+            m = _CUSTOMER_RE.search(q)
             if m:
                 cid = m.group(1).strip().upper()
-                row = self.df[(self.df['customer_id'].astype(str).str.upper() == cid) | (self.df['company_name'].str.upper() == cid)]
-                if row.empty:
+                pos = self._row_by_key.get(cid)
+                if pos is None:
                     return f"No customer matching '{cid}'. Try a customer id like C00001."
-                return customer_insight(row.iloc[0])
+                return customer_insight(self.df.iloc[pos])
         
         return None
     
@@ -262,43 +357,56 @@ class EnhancedChatbot:
         if context is None:
             context = {}
         
+        # Normalize once and share with the sub-handlers
+        q = query.lower().strip()
+        
         # Handle social interactions first
-        social_response = self._handle_social_interactions(query)
+        social_response = self._handle_social_interactions(q)
         if social_response:
             return social_response, context
         
         # Handle follow-up requests
-        follow_up_response = self._handle_follow_up_requests(query, context)
+        follow_up_response = self._handle_follow_up_requests(q, context)
         if follow_up_response:
             return follow_up_response, context
         
         # Determine query complexity
-        complexity = self._detect_query_complexity(query)
+        complexity = self._detect_query_complexity(q)
         
         # Try rule-based responses first for simple queries
         if complexity < self.rag_threshold:
-            rule_response = self._handle_rule_based_intents(query, context)
+            rule_response = self._handle_rule_based_intents(q, context)
             if rule_response:
                 return rule_response, context
         
         # Use RAG for complex queries or when rule-based fails
         if self.use_rag and self.rag_chatbot:
             try:
+                # Serve near-duplicate queries from the semantic cache before calling Gemini
+                cacheable = not _HAS_DIGIT_RE.search(q)
+                if cacheable:
+                    embedding = self.rag_chatbot.embed_query(query)
+                    cached = self._sem_cache.get(embedding)
+                    if cached is not None:
+                        return cached, context
+                
                 rag_response = self.rag_chatbot.chat(query)
                 if rag_response and "I couldn't find relevant information" not in rag_response:
+                    if cacheable and not rag_response.startswith("I apologize"):
+                        self._sem_cache.put(embedding, rag_response)
                     return rag_response, context
             except Exception as e:
                 print(f"RAG error: {e}")
         
         # Fallback to rule-based for complex queries if RAG fails
         if complexity >= self.rag_threshold:
-            rule_response = self._handle_rule_based_intents(query, context)
+            rule_response = self._handle_rule_based_intents(q, context)
             if rule_response:
                 return rule_response, context
         
         # Final fallback
-        closest = get_close_matches(query.lower(), self.DEFAULT_SUGGESTIONS, n=1)
-        hint = f" Did you mean: '{closest[0]}'?" if closest else ""
+        closest = _closest_suggestion(q)
+        hint = f" Did you mean: '{closest}'?" if closest else ""
         
         suggestions = "\n".join([f"• {suggestion}" for suggestion in self.DEFAULT_SUGGESTIONS[:5]])
         return f"🤔 I didn't quite understand that query. Here are some things you can ask me:\n\n{suggestions}\n\n{hint}", context
@@ -346,6 +454,43 @@ if __name__ == "__main__":
             print(f"Error: {e}")
 
 
+# Enhanced chatbots by (api key, data file); the lock keeps concurrent first requests from each building one
+_chatbots: Dict[Tuple[str, str], EnhancedChatbot] = {}
+_chatbots_lock = threading.Lock()
+
+
+def _get_chatbot(gemini_api_key: str, data_file_path: str) -> EnhancedChatbot:
+    """Build the enhanced chatbot once per (api key, data file) and reuse it across requests."""
+    key = (gemini_api_key, data_file_path)
+    chatbot = _chatbots.get(key)
+    if chatbot is None:
+        with _chatbots_lock:
+            # another thread may have built it while this one waited
+            chatbot = _chatbots.get(key)
+            if chatbot is None:
+                chatbot = _chatbots[key] = EnhancedChatbot(
+                    gemini_api_key=gemini_api_key,
+                    data_file_path=data_file_path,
+                    use_rag=True
+                )
+    return chatbot
+
+
+# Rotating replies for the legacy rule-based fallback
+_LEGACY_GREETING_REPLIES = cycle([
+    "Hello! 👋 How can I help with CRM insights today?",
+    "Hi there — ask me about churn, segments, or upsell opportunities."
+])
+_LEGACY_THANKS_REPLIES = cycle([
+    "You're welcome! 😊",
+    "Happy to help!"
+])
+_LEGACY_BYE_REPLIES = cycle([
+    "Goodbye! 👋",
+    "Talk soon — good luck with the demo! 🎥"
+])
+
+
 # Compatibility function for existing server.py
 def handle_query(query: str, df, context: dict = None):
     """
@@ -360,12 +505,8 @@ def handle_query(query: str, df, context: dict = None):
         # Check if we have a Gemini API key
         gemini_api_key = os.getenv("GEMINI_API_KEY")
         if gemini_api_key and gemini_api_key != "your-gemini-api-key-here":
-            # Use enhanced chatbot
-            chatbot = EnhancedChatbot(
-                gemini_api_key=gemini_api_key,
-                data_file_path="data/processed_customers.csv",
-                use_rag=True
-            )
+            # Use the cached enhanced chatbot
+            chatbot = _get_chatbot(gemini_api_key, "data/processed_customers.csv")
             response, context = chatbot.handle_query(query, context)
             return response, context
     except Exception as e:
@@ -383,41 +524,16 @@ def handle_query(query: str, df, context: dict = None):
         return any(w in phrase for w in words)
     
     if _is_contained_any(q, GREETINGS):
-        return random.choice([
-            "Hello! 👋 How can I help with CRM insights today?",
-            "Hi there — ask me about churn, segments, or upsell opportunities."
-        ]), context
+        return next(_LEGACY_GREETING_REPLIES), context
     
     if _is_contained_any(q, THANKS):
-        return random.choice([
-            "You're welcome! 😊",
-            "Happy to help!"
-        ]), context
+        return next(_LEGACY_THANKS_REPLIES), context
     
     if _is_contained_any(q, BYES):
-        return random.choice([
-            "Goodbye! 👋",
-            "Talk soon — good luck with the demo! 🎥"
-        ]), context
+        return next(_LEGACY_BYE_REPLIES), context
     
     # Intent detection and handling
-    intents = {
-        "churn": ["churn", "at risk", "likely to cancel", "leaving", "show top churn accounts", "who are at risk"],
-        "high_risk": ["high risk", "very risky", "extreme churn"],
-        "low_risk": ["low risk", "safe customers", "loyal customers", "list low-risk customers"],
-        "high_value": ["high-value", "high value", "top customers", "best customers", "show high-value customers"],
-        "upsell": ["upsell", "cross-sell", "expansion", "growth", "upsell candidates", "suggest upsell"],
-        "segment": ["segment", "group", "distribution", "breakdown", "show customer segments", "show distribution of segments"],
-        "customer": ["tell me about", "info on", "details for", "show customer", "who is"]
-    }
-    
-    def match_intent(phrase):
-        for intent, words in intents.items():
-            if any(w in phrase for w in words):
-                return intent
-        return None
-    
-    intent = match_intent(q)
+    intent = classify_intent(q)
     
     # Handle specific intents
     if intent in ['churn', 'high_risk']:
@@ -434,22 +550,31 @@ def handle_query(query: str, df, context: dict = None):
         rows = df[df['churn_prob'] < 0.2].sort_values('churn_prob').head(10)
         if rows.empty:
             return "No low-risk customers found.", context
-        lines = [f"{i+1}. {r['company_name']} (ID {r['customer_id']}) — churn {r['churn_prob']:.0%}" for i, r in rows.iterrows()]
+        cols = ['company_name', 'customer_id', 'churn_prob']
+        lines = [
+            f"{i}. {name} (ID {cid}) — churn {prob:.0%}"
+            for i, (name, cid, prob) in enumerate(rows[cols].itertuples(index=False, name=None), start=1)
+        ]
         return "✅ Low-risk customers:\n" + "\n".join(lines), context
     
     if intent == 'high_value':
         rows = df[df['segment'] == 'high_value'].sort_values('purchase_history', ascending=False).head(10)
         if rows.empty:
             return "No high-value customers found.", context
-        lines = [f"{i+1}. {r['company_name']} (ID {r['customer_id']}) — spent ${r['purchase_history']:,}" for i, r in rows.iterrows()]
+        cols = ['company_name', 'customer_id', 'purchase_history']
+        lines = [
+            f"{i}. {name} (ID {cid}) — spent ${spent:,}"
+            for i, (name, cid, spent) in enumerate(rows[cols].itertuples(index=False, name=None), start=1)
+        ]
         return "🏆 High-value customers:\n" + "\n".join(lines), context
     
     if intent == 'upsell':
-        cand = []
-        for _, r in df.iterrows():
-            rec = recommend_upsell(r)
-            if rec:
-                cand.append({"id": r.get('customer_id'), "company": r.get('company_name'), "rec": rec})
+        recs = recommend_upsell_vec(df)
+        cand_df = df.loc[recs.notna()].head(10)
+        cand = [
+            {"id": cid, "company": cname, "rec": rec}
+            for cid, cname, rec in zip(cand_df['customer_id'], cand_df['company_name'], recs[cand_df.index])
+        ]
         if not cand:
             return "No immediate upsell candidates found by the rule.", context
         lines = [f"{i+1}. {c['company']} (ID {c['id']}) — {c['rec']}" for i, c in enumerate(cand[:10])]
@@ -460,28 +585,16 @@ def handle_query(query: str, df, context: dict = None):
         return f"📊 Segment distribution:\n{dist}", context
     
     if intent == 'customer':
-        m = re.search(r'(?:tell me about|info on|details for|show customer|who is)\s+([A-Za-z0-9_ -]+)', q)
+        m = _CUSTOMER_RE.search(q)
         if m:
             cid = m.group(1).strip().upper()
-            row = df[(df['customer_id'].astype(str).str.upper() == cid) | (df['company_name'].str.upper() == cid)]
-            if row.empty:
+            _, cid_upper, name_upper = _legacy_upper_keys(df)
+            hits = ((cid_upper == cid) | (name_upper == cid)).nonzero()[0]
+            if not len(hits):
                 return f"No customer matching '{cid}'. Try a customer id like C00001.", context
-            return customer_insight(row.iloc[0]), context
+            return customer_insight(df.iloc[hits[0]]), context
     
     # Fallback
-    DEFAULT_SUGGESTIONS = [
-        "show top churn accounts",
-        "suggest upsell for high-value segment",
-        "show customer segments",
-        "list low-risk customers",
-        "show high-value customers",
-        "tell me about C00001",
-        "who are at risk of churn",
-        "give details for 2",
-        "upsell candidates",
-        "show distribution of segments"
-    ]
-    
-    closest = get_close_matches(q, DEFAULT_SUGGESTIONS, n=1)
-    hint = f" Did you mean: '{closest[0]}'?" if closest else ""
+    closest = _closest_suggestion(q)
+    hint = f" Did you mean: '{closest}'?" if closest else ""
     return "🤔 I didn't quite get that." + hint, context
@@ -0,0 +1,33 @@
+"""
+Shared loader for the processed customer table written by ml_models.py
+(data/processed_customers.csv plus its typed parquet copy).
+"""
+
+import os
+import pandas as pd
+
+DATE_COLUMNS = ["signup_date", "last_interaction_date"]
+
+
+def parquet_path(csv_path: str) -> str:
+    """Path of the parquet copy ml_models.py writes next to the processed CSV."""
+    return os.path.splitext(csv_path)[0] + ".parquet"
+
+
+def read_processed(csv_path: str) -> pd.DataFrame:
+    """
+    Read the processed customers. The parquet copy is typed already, so it is used
+    unless the CSV is newer; otherwise the CSV is parsed (Arrow reader when pyarrow is installed).
+    """
+    pq = parquet_path(csv_path)
+    has_csv = os.path.exists(csv_path)
+    if os.path.exists(pq) and (not has_csv or os.path.getmtime(pq) >= os.path.getmtime(csv_path)):
+        try:
+            return pd.read_parquet(pq, engine="pyarrow")
+        except ImportError:
+            if not has_csv:
+                raise
+    try:
+        return pd.read_csv(csv_path, engine="pyarrow", parse_dates=DATE_COLUMNS)
+    except ImportError:
+        return pd.read_csv(csv_path, low_memory=False, parse_dates=DATE_COLUMNS)
@@ -1,6 +1,7 @@
 # insights.py
 import datetime
 import random
+import numpy as np
 
 # Predefined realistic upsell offers for a fictional B2B software company
 UPSELL_OFFERS = [
@@ -12,9 +13,14 @@ UPSELL_OFFERS = [
     "Upgrade to Dedicated Account Manager + Priority Support"
 ]
 
+OUTREACH_ACTION = "Recommend outreach: phone call within 48h + 10% renewal incentive."
+REVIEW_ACTION = "Recommend targeted upsell or account review."
+# Insight text shared by customer_insight and customer_insights_vec
+INSIGHT_TEMPLATE = "{name} (segment: {seg}) — churn: {prob:.0%}. Last interaction: {last}. Key signals: {reasons}. {action}"
+
 def customer_insight(row):
     """
-    row: a pandas Series representing a single customer (must contain churn_prob, engagement_score, segment, last_interaction_date)
+    row: a pandas Series or dict representing a single customer (must contain churn_prob, engagement_score, segment, last_interaction_date)
     returns: short text insight
     """
     name = row.get('company_name', row.get('customer_id', 'Unknown'))
@@ -33,23 +39,56 @@ def customer_insight(row):
         reasons.append("no recent contact")
 
     reason_text = ", ".join(reasons) if reasons else "mixed indicators"
-    action = (
-        "Recommend outreach: phone call within 48h + 10% renewal incentive."
-        if prob > 0.6
-        else "Recommend targeted upsell or account review."
-    )
+    action = OUTREACH_ACTION if prob > 0.6 else REVIEW_ACTION
 
-    text = f"{name} (segment: {seg}) — churn: {prob:.0%}. Last interaction: {last_str}. Key signals: {reason_text}. {action}"
+    text = INSIGHT_TEMPLATE.format(name=name, seg=seg, prob=prob, last=last_str, reasons=reason_text, action=action)
     return text
 
+def _values(df, name, default):
+    # column as a NumPy array, or the default repeated when the column is missing
+    return df[name].to_numpy() if name in df.columns else np.full(len(df), default, dtype=object)
+
+def customer_insights_vec(df):
+    """
+    Same text as customer_insight, built for every row of df at once.
+    returns: list of insight strings in row order
+    """
+    names = _values(df, 'company_name', None) if 'company_name' in df.columns else _values(df, 'customer_id', 'Unknown')
+    prob = _values(df, 'churn_prob', 0).astype(float)
+    eng = _values(df, 'engagement_score', 0).astype(float)
+    recency = _values(df, 'recency_days', 0).astype(float)
+    seg = _values(df, 'segment', 'unknown')
+    if 'last_interaction_date' in df.columns:
+        last = df['last_interaction_date'].map(lambda v: str(v)[:10] if v is not None else 'N/A').to_numpy()
+    else:
+        last = np.full(len(df), 'N/A', dtype=object)
+
+    high_churn = prob > 0.6
+    r1 = np.where(high_churn, "high churn probability", "")
+    r2 = np.where(eng < 0.35, "low engagement", "")
+    r3 = np.where(recency > 90, "no recent contact", "")
+    action = np.where(high_churn, OUTREACH_ACTION, REVIEW_ACTION)
+
+    out = []
+    for name, s, p, l, a, b, c, act in zip(names, seg, prob, last, r1, r2, r3, action):
+        reason_text = ", ".join(filter(None, (a, b, c))) or "mixed indicators"
+        out.append(INSIGHT_TEMPLATE.format(name=name, seg=s, prob=p, last=l, reasons=reason_text, action=act))
+    return out
+
 def top_insights(df, n=10):
+    top = df.nlargest(n, 'churn_prob')
     out = []
-    for _, r in df.sort_values('churn_prob', ascending=False).head(n).iterrows():
+    for cid, cname, prob, insight in zip(
+        _values(top, 'customer_id', None).tolist(),
+        _values(top, 'company_name', None).tolist(),
+        _values(top, 'churn_prob', 0).astype(float).tolist(),
+        customer_insights_vec(top)
+    ):
         out.append({
-            "customer_id": r.get('customer_id'),
-            "company_name": r.get('company_name'),
-            "churn_prob": float(r.get('churn_prob', 0)),
-            "insight": customer_insight(r)
+            "customer_id": cid,
+            "company_name": cname,
+            "churn_prob": prob,
+            "insight": insight
         })
     return out
 
@@ -63,3 +102,42 @@ def recommend_upsell(row):
         offer = random.choice(UPSELL_OFFERS)
         return f"{row.get('company_name')} is a strong candidate for upsell → {offer}."
     return None
+
+SEGMENTS = ['mid_value', 'high_value', 'at_risk']
+HIGH_VALUE_CODE = SEGMENTS.index('high_value')
+
+class CustomerSoA:
+    """
+    Column arrays for the fields the upsell rules read, one entry per row of df.
+    segment is stored as int8 codes into SEGMENTS (-1 for anything else).
+    """
+    def __init__(self, df):
+        self.churn_prob = _values(df, 'churn_prob', 0).astype(np.float64)
+        self.product_diversity = _values(df, 'product_diversity', 0).astype(np.float32)
+        segment = _values(df, 'segment', None)
+        self.segment_code = np.full(len(segment), -1, dtype=np.int8)
+        for code, name in enumerate(SEGMENTS):
+            self.segment_code[segment == name] = code
+
+    def upsell_mask(self):
+        # same rule as recommend_upsell, for every customer at once
+        return (
+            (self.segment_code == HIGH_VALUE_CODE)
+            & (self.product_diversity <= 2)
+            & (self.churn_prob < 0.4)
+        )
+
+def recommend_upsell_vec(df):
+    """
+    Vectorized recommend_upsell over a whole DataFrame.
+    returns: Series aligned to df.index with the recommendation text for candidates and NaN elsewhere
+    """
+    # Imported lazily so importing this module (and chatbot.py) stays cheap
+    import pandas as pd
+
+    mask = CustomerSoA(df).upsell_mask()
+    recs = [
+        f"{name} is a strong candidate for upsell → {random.choice(UPSELL_OFFERS)}."
+        for name in _values(df, 'company_name', None)[mask]
+    ]
+    return pd.Series(recs, index=df.index[mask], dtype=object).reindex(df.index)
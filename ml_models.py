@@ -1,15 +1,29 @@
 # ml_models.py
-import os, json
+import os, json, hashlib
 import joblib
 import pandas as pd
 import numpy as np
 from datetime import datetime
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
-from sklearn.ensemble import RandomForestClassifier
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import roc_auc_score, silhouette_score
 
+MODEL_FILES = ['models/scaler.pkl', 'models/kmeans.pkl', 'models/rf_churn.pkl']
+FINGERPRINT_FILE = 'models/fingerprint.txt'
+# above this many rows the churn model uses histogram gradient boosting instead of a random forest
+HIST_GB_MIN_ROWS = 10000
+# above this many rows segmentation uses mini-batch k-means and a subsampled silhouette score
+MINIBATCH_MIN_ROWS = 10000
+SILHOUETTE_SAMPLE = 5000
+
+# on-disk memo of model fits keyed by their input arrays, so repeated experiments skip refitting
+memory = joblib.Memory('.cache', verbose=0)
+
+# segment label lookup table indexed by cluster code (0 = mid, 1 = high value, 2 = at risk)
+SEGMENT_LABELS = np.array(['mid_value', 'high_value', 'at_risk'])
+
 def find_input():
     candidates = ['data/mock_crm.csv', 'data/crm_data.csv', 'data/processed_customers.csv']
     for p in candidates:
@@ -17,11 +31,20 @@ def find_input():
             return p
     raise SystemExit("Put your mock CSV in data/mock_crm.csv or data/crm_data.csv")
 
+DATE_COLUMNS = ['signup_date','signup','last_interaction_date','last_interaction','last_contact','last_seen']
+
 def load_df(path):
-    df = pd.read_csv(path, low_memory=False)
-    # try to parse common date columns
-    for col in ['signup_date','signup','last_interaction_date','last_interaction','last_contact','last_seen']:
-        if col in df.columns:
+    header = pd.read_csv(path, nrows=0).columns
+    date_cols = [c for c in DATE_COLUMNS if c in header]
+    dtype = {c: 'category' for c in ['industry','segment'] if c in header}
+    # multi-threaded Arrow reader when pyarrow is installed, C parser otherwise
+    try:
+        df = pd.read_csv(path, engine='pyarrow', parse_dates=date_cols, dtype=dtype)
+    except ImportError:
+        df = pd.read_csv(path, low_memory=False, parse_dates=date_cols, dtype=dtype)
+    # parse_dates leaves columns with unparseable values as text; coerce those to NaT
+    for col in date_cols:
+        if not pd.api.types.is_datetime64_any_dtype(df[col]):
             df[col] = pd.to_datetime(df[col], errors='coerce')
     return df
 
@@ -41,7 +64,7 @@ def normalize_columns(df):
 
     # rename where applicable
     for src, tgt in colmap.items():
-        if src in df.columns:
+        if src != tgt and src in df.columns:
             df[tgt] = df[src]
 
     # fill defaults for missing numeric columns
@@ -51,6 +74,32 @@ def normalize_columns(df):
 
     return df
 
+def _json_len(x):
+    try:
+        return len(json.loads(x))
+    except (ValueError, TypeError):
+        return 0
+
+def count_categories(pc):
+    # number of product categories per row from ';'-separated or JSON list strings (0 for missing)
+    diversity = pd.Series(0, index=pc.index)
+    if pc.dtype != object and not pd.api.types.is_string_dtype(pc):
+        return diversity
+    n_sep = pc.str.count(';')           # NaN for anything that is not a string
+    is_str = n_sep.notna()
+    is_json = is_str & pc.str.strip().str.startswith('[', na=False)
+    is_text = is_str & ~is_json
+    diversity[is_text] = n_sep[is_text].astype(int) + 1
+    # only the (rare) JSON-encoded rows need a Python-level parse
+    diversity[is_json] = pc[is_json].map(_json_len)
+    return diversity
+
+def days_before(today, dates, fill):
+    # whole days from each date up to today (floored like Timedelta.days), fill where the date is missing
+    d = dates.to_numpy(dtype='datetime64[ns]')
+    days = (today.value - d.view(np.int64)) // 86_400_000_000_000
+    return np.where(np.isnat(d), fill, days)
+
 def engineer_features(df):
     today = pd.to_datetime("2025-09-05")  # fixed for reproducibility
     # choose last interaction column
@@ -69,21 +118,12 @@ def engineer_features(df):
     else:
         df['signup_date'] = pd.to_datetime(df[signup_col], errors='coerce')
 
-    df['recency_days'] = (today - df['last_interaction_date']).dt.days.fillna(9999).astype(int)
-    df['tenure_days'] = (today - df['signup_date']).dt.days.fillna(0).astype(int)
+    df['recency_days'] = days_before(today, df['last_interaction_date'], 9999)
+    df['tenure_days'] = days_before(today, df['signup_date'], 0)
 
     # product diversity if present
     if 'product_categories' in df.columns:
-        def pd_len(x):
-            try:
-                if pd.isna(x): return 0
-                if isinstance(x, str):
-                    j=json.loads(x) if x.strip().startswith('[') else x.split(';')
-                    return len(j)
-                return len(x)
-            except:
-                return 0
-        df['product_diversity'] = df['product_categories'].apply(pd_len)
+        df['product_diversity'] = count_categories(df['product_categories'])
     else:
         df['product_diversity'] = 1
 
@@ -94,41 +134,98 @@ def engineer_features(df):
 
     return df
 
-def train_and_save(df):
-    features = ['recency_days','frequency','monetary','engagement_score','product_diversity','tenure_days']
-    X = df[features].fillna(0).values
+def data_fingerprint(df, features, model_kind='rf'):
+    # hash of the training inputs (features plus given churn labels); unchanged data -> same models
+    cols = features + (['churn'] if 'churn' in df.columns else [])
+    h = hashlib.sha1(",".join(cols + [model_kind]).encode())
+    h.update(pd.util.hash_pandas_object(df[cols], index=False).values.tobytes())
+    return h.hexdigest()
+
+def load_cached_models(fingerprint):
+    # (scaler, kmeans, rf) saved for this fingerprint, or None if they need refitting
+    if not all(os.path.exists(p) for p in MODEL_FILES + [FINGERPRINT_FILE]):
+        return None
+    with open(FINGERPRINT_FILE) as f:
+        if f.read().strip() != fingerprint:
+            return None
+    return tuple(joblib.load(p) for p in MODEL_FILES)
 
+@memory.cache
+def fit_scaler(X):
     scaler = StandardScaler()
-    Xs = scaler.fit_transform(X)
+    return scaler, scaler.fit_transform(X)
+
+@memory.cache
+def fit_kmeans(Xs):
+    if len(Xs) > MINIBATCH_MIN_ROWS:
+        kmeans = MiniBatchKMeans(n_clusters=3, batch_size=min(1024, max(64, len(Xs)//4)), n_init=3, random_state=42)
+    else:
+        kmeans = KMeans(n_clusters=3, random_state=42, n_init=10, algorithm='elkan')
+    return kmeans.fit(Xs)
+
+@memory.cache
+def fit_churn_model(X_train, y_train, use_hist):
+    if use_hist:
+        rf = HistGradientBoostingClassifier(max_iter=200, learning_rate=0.05, class_weight='balanced', random_state=42)
+    else:
+        rf = RandomForestClassifier(n_estimators=100, n_jobs=-1, class_weight='balanced', random_state=42)
+    return rf.fit(X_train, y_train)
+
+def train_and_save(df, use_hist=None):
+    # use_hist: churn model choice; None picks HistGradientBoosting for large data, RandomForest otherwise
+    features = ['recency_days','frequency','monetary','engagement_score','product_diversity','tenure_days']
+    # scale in float64, then hand sklearn float32 (trees convert to float32 internally anyway)
+    X = df[features].to_numpy(dtype=np.float64, na_value=0.0)
     os.makedirs('models', exist_ok=True)
-    joblib.dump(scaler, 'models/scaler.pkl')
+    if use_hist is None:
+        use_hist = len(df) > HIST_GB_MIN_ROWS
+
+    fingerprint = data_fingerprint(df, features, 'hist_gb' if use_hist else 'rf')
+    cached = load_cached_models(fingerprint)
+    if cached:
+        print("Input data unchanged - reusing saved models")
+        scaler, kmeans, rf = cached
+        Xs = scaler.transform(X).astype(np.float32, copy=False)
+    else:
+        scaler, Xs = fit_scaler(X)
+        Xs = Xs.astype(np.float32, copy=False)
+        joblib.dump(scaler, 'models/scaler.pkl')
 
-    kmeans = KMeans(n_clusters=3, random_state=42, n_init=10)
-    kmeans.fit(Xs)
-    joblib.dump(kmeans, 'models/kmeans.pkl')
+        kmeans = fit_kmeans(Xs)
+        joblib.dump(kmeans, 'models/kmeans.pkl')
     df['cluster'] = kmeans.predict(Xs)
 
     # label clusters heuristically
-    profile = df.groupby('cluster')[['monetary','recency_days','engagement_score']].mean()
-    high_value_cluster = profile['monetary'].idxmax()
-    at_risk_cluster = profile['recency_days'].idxmax()
-    label_map = {c:('high_value' if c==high_value_cluster else ('at_risk' if c==at_risk_cluster else 'mid_value')) for c in profile.index}
-    df['segment'] = df['cluster'].map(label_map)
+    cluster = df['cluster'].to_numpy()
+    counts = np.bincount(cluster, minlength=kmeans.n_clusters)
+    sums = np.stack([np.bincount(cluster, weights=df[c].to_numpy(dtype=float), minlength=kmeans.n_clusters)
+                     for c in ['monetary','recency_days']], axis=1)
+    # empty clusters get -inf so argmax never picks them (groupby used to leave them out)
+    profile = np.divide(sums, counts[:, None], out=np.full(sums.shape, -np.inf), where=counts[:, None] > 0)
+    high_value_cluster = int(profile[:,0].argmax())
+    at_risk_cluster = int(profile[:,1].argmax())
+    code = np.where(cluster == high_value_cluster, 1, np.where(cluster == at_risk_cluster, 2, 0))
+    df['segment'] = SEGMENT_LABELS[code]
 
     # churn label: use existing if present else synthetic
     if 'churn' in df.columns:
         df['churn_label'] = pd.to_numeric(df['churn'], errors='coerce').fillna(0).astype(int)
     else:
-        df['churn_label'] = (((df['recency_days'] > 90) & (df['engagement_score'] < 0.35)) | ((df['frequency'] == 0) & (df['recency_days']>60))).astype(int)
+        r = df['recency_days'].to_numpy()
+        e = df['engagement_score'].to_numpy()
+        f = df['frequency'].to_numpy()
+        df['churn_label'] = (((r > 90) & (e < 0.35)) | ((f == 0) & (r > 60))).astype(np.int8)
 
     # train RF
     y = df['churn_label'].values
     if y.sum() == 0:
         print("Warning: no positive churn labels found. Synthetic labels used - treat model as demo-only.")
     X_train, X_test, y_train, y_test = train_test_split(Xs, y, test_size=0.2, random_state=42, stratify=y if y.sum()>0 else None)
-    rf = RandomForestClassifier(n_estimators=100, class_weight='balanced', random_state=42)
-    rf.fit(X_train, y_train)
-    joblib.dump(rf, 'models/rf_churn.pkl')
+    if not cached:
+        rf = fit_churn_model(X_train, y_train, use_hist)
+        joblib.dump(rf, 'models/rf_churn.pkl')
+        with open(FINGERPRINT_FILE, 'w') as f:
+            f.write(fingerprint)
 
     # churn prob
     df['churn_prob'] = rf.predict_proba(Xs)[:,1]
@@ -138,10 +235,20 @@ def train_and_save(df):
         auc = roc_auc_score(y_test, rf.predict_proba(X_test)[:,1])
     except:
         auc = None
-    sil = silhouette_score(Xs, df['cluster']) if len(np.unique(df['cluster']))>1 else None
+    if len(np.unique(df['cluster']))>1:
+        sample_size = SILHOUETTE_SAMPLE if len(Xs) > SILHOUETTE_SAMPLE else None
+        sil = silhouette_score(Xs, df['cluster'], sample_size=sample_size, random_state=42)
+    else:
+        sil = None
 
     df.to_csv('data/processed_customers.csv', index=False)
     print("Saved models to models/ and processed data to data/processed_customers.csv")
+    # typed columnar copy for the server's fast load path (needs pyarrow)
+    try:
+        df.to_parquet('data/processed_customers.parquet', compression='zstd', index=False)
+        print("Saved parquet copy to data/processed_customers.parquet")
+    except ImportError:
+        pass
     print("Diagnostics - ROC AUC (test):", auc, " Silhouette:", sil)
 
 if __name__ == "__main__":
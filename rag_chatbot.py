@@ -4,6 +4,10 @@ This module provides a retrieval-augmented generation chatbot for CRM insights.
 """
 
 import os
+import threading
+import time
+from functools import lru_cache
+import numpy as np
 import pandas as pd
 import chromadb
 from chromadb.config import Settings
@@ -17,7 +21,112 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class SemanticCache:
+    """
+    Small in-memory cache of generated responses keyed by query embedding.
+    A lookup hits when a cached query's embedding has cosine similarity >= threshold
+    and was stored less than ttl_seconds ago. Embeddings must be L2-normalized.
+    Safe to share between request threads: every method holds the instance lock.
+    """
+    
+    def __init__(self, threshold: float = 0.95, ttl_seconds: float = 300, max_entries: int = 256):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._vectors = None
+        self._responses: List[str] = []
+        self._timestamps: List[float] = []
+        self._lock = threading.Lock()
+    
+    def _evict_expired(self):
+        """Drop entries older than the TTL (entries are stored oldest first). Caller holds the lock."""
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = 0
+        while expired < len(self._timestamps) and self._timestamps[expired] < cutoff:
+            expired += 1
+        if expired:
+            self._vectors = self._vectors[expired:]
+            del self._responses[:expired]
+            del self._timestamps[:expired]
+    
+    def get(self, embedding: np.ndarray) -> Optional[str]:
+        """Return the cached response for the closest similar query, if any."""
+        with self._lock:
+            self._evict_expired()
+            if not self._responses:
+                return None
+            sims = self._vectors @ embedding
+            best = int(sims.argmax())
+            return self._responses[best] if sims[best] >= self.threshold else None
+    
+    def put(self, embedding: np.ndarray, response: str):
+        """Store a response, evicting the oldest entry when full."""
+        row = embedding[np.newaxis, :]
+        with self._lock:
+            self._evict_expired()
+            # keep the newest max_entries - 1 entries to make room for this one
+            start = max(len(self._responses) - self.max_entries + 1, 0)
+            if self._vectors is None or not self._responses:
+                self._vectors = row
+            else:
+                self._vectors = np.vstack([self._vectors[start:], row])
+            self._responses = self._responses[start:] + [response]
+            self._timestamps = self._timestamps[start:] + [time.monotonic()]
+
+
+# Text stored and embedded for each customer; fields missing from the data use DOCUMENT_DEFAULTS
+DOCUMENT_TEMPLATE = (
+    "Customer ID: {customer_id}\n"
+    "Company Name: {company_name}\n"
+    "Industry: {industry}\n"
+    "Purchase History: ${purchase_history:,}\n"
+    "Engagement Score: {engagement_score}\n"
+    "Last Interaction: {last_interaction_date}\n"
+    "Churn Status: {churn_status}\n"
+    "Segment: {segment}\n"
+    "Churn Probability: {churn_prob:.2%}\n"
+    "Total Spend: ${total_spend:,}\n"
+    "Tenure Days: {tenure_days}\n"
+    "Product Diversity: {product_diversity}"
+)
+
+DOCUMENT_DEFAULTS = {
+    'customer_id': 'N/A',
+    'company_name': 'N/A',
+    'industry': 'N/A',
+    'purchase_history': 0,
+    'engagement_score': 0,
+    'last_interaction_date': 'N/A',
+    'churn': 0,
+    'segment': 'N/A',
+    'churn_prob': 0,
+    'total_spend': 0,
+    'tenure_days': 0,
+    'product_diversity': 0
+}
+
+
 class RAGChatbot:
+    SYSTEM_PROMPT = (
+        "You are an AI assistant specialized in Customer Relationship Management (CRM) insights.\n"
+        "You have access to customer data and should provide helpful, accurate responses based on the context provided."
+    )
+    PROMPT_TEMPLATE = SYSTEM_PROMPT + """
+
+Context from CRM database:
+{context}
+
+User Query: {query}
+
+Please provide a helpful response based on the context above. If the query is about specific customers,
+use the provided data. If it's a general question about CRM insights, provide analysis based on the data.
+Be conversational but professional, and include relevant metrics when appropriate.
+
+Response:
+"""
+    # Upper bound on retrieved context sent to Gemini (about 1k tokens)
+    MAX_CONTEXT_CHARS = 4000
+    
     def __init__(self, 
                  gemini_api_key: str,
                  data_file_path: str,
@@ -41,7 +150,11 @@ class RAGChatbot:
         self._setup_gemini()
         self._setup_chromadb()
         self._setup_embedder()
-        self._load_data()
+        # CRM data is read on first use; warm starts with an up-to-date collection never need it
+        self._df = None
+        
+        # Per-instance memo of query embeddings; repeated questions skip the encoder
+        self._cached_query_embedding = lru_cache(maxsize=512)(self._encode_query)
         
         # Initialize or load the vector database
         self._initialize_vector_db()
@@ -77,11 +190,25 @@ class RAGChatbot:
             logger.error(f"Failed to initialize sentence transformer: {e}")
             raise
     
+    @property
+    def df(self) -> pd.DataFrame:
+        """CRM data, loaded from data_file_path on first access."""
+        if self._df is None:
+            self._load_data()
+        return self._df
+    
     def _load_data(self):
-        """Load and preprocess the CRM data."""
+        """Load the CRM columns used for the document chunks."""
         try:
-            self.df = pd.read_csv(self.data_file_path)
-            logger.info(f"Loaded data with {len(self.df)} records")
+            header = pd.read_csv(self.data_file_path, nrows=0).columns
+            usecols = [c for c in header if c in DOCUMENT_DEFAULTS]
+            dtype = {c: 'category' for c in ['industry', 'segment'] if c in header}
+            # Multi-threaded Arrow reader when pyarrow is installed, C parser otherwise
+            try:
+                self._df = pd.read_csv(self.data_file_path, engine='pyarrow', usecols=usecols, dtype=dtype)
+            except ImportError:
+                self._df = pd.read_csv(self.data_file_path, usecols=usecols, dtype=dtype)
+            logger.info(f"Loaded data with {len(self._df)} records")
         except Exception as e:
             logger.error(f"Failed to load data: {e}")
             raise
@@ -91,42 +218,30 @@ class RAGChatbot:
         Create document chunks from the CRM data for vector storage.
         Each chunk represents a customer record with relevant context.
         """
-        chunks = []
+        present = [c for c in DOCUMENT_DEFAULTS if c in self.df.columns]
+        records = self.df[present].to_dict('records')
         
-        for _, row in self.df.iterrows():
-            # Create a comprehensive text representation of each customer
-            customer_text = f"""
-            Customer ID: {row.get('customer_id', 'N/A')}
-            Company Name: {row.get('company_name', 'N/A')}
-            Industry: {row.get('industry', 'N/A')}
-            Purchase History: ${row.get('purchase_history', 0):,}
-            Engagement Score: {row.get('engagement_score', 0)}
-            Last Interaction: {row.get('last_interaction_date', 'N/A')}
-            Churn Status: {'Churned' if row.get('churn', 0) == 1 else 'Active'}
-            Segment: {row.get('segment', 'N/A')}
-            Churn Probability: {row.get('churn_prob', 0):.2%}
-            Total Spend: ${row.get('total_spend', 0):,}
-            Tenure Days: {row.get('tenure_days', 0)}
-            Product Diversity: {row.get('product_diversity', 0)}
-            """
-            
-            # Create metadata for filtering and context
-            metadata = {
-                'customer_id': str(row.get('customer_id', '')),
-                'company_name': str(row.get('company_name', '')),
-                'industry': str(row.get('industry', '')),
-                'segment': str(row.get('segment', '')),
-                'churn_status': 'churned' if row.get('churn', 0) == 1 else 'active',
-                'churn_probability': float(row.get('churn_prob', 0)),
-                'purchase_history': float(row.get('purchase_history', 0)),
-                'engagement_score': float(row.get('engagement_score', 0))
+        chunks = [
+            {
+                'id': f"customer_{r.get('customer_id', '')}",
+                'text': DOCUMENT_TEMPLATE.format(
+                    **{**DOCUMENT_DEFAULTS, **r},
+                    churn_status='Churned' if r.get('churn', 0) == 1 else 'Active'
+                ),
+                # Metadata for filtering and context
+                'metadata': {
+                    'customer_id': str(r.get('customer_id', '')),
+                    'company_name': str(r.get('company_name', '')),
+                    'industry': str(r.get('industry', '')),
+                    'segment': str(r.get('segment', '')),
+                    'churn_status': 'churned' if r.get('churn', 0) == 1 else 'active',
+                    'churn_probability': float(r.get('churn_prob', 0)),
+                    'purchase_history': float(r.get('purchase_history', 0)),
+                    'engagement_score': float(r.get('engagement_score', 0))
+                }
             }
-            
-            chunks.append({
-                'id': f"customer_{row.get('customer_id', '')}",
-                'text': customer_text.strip(),
-                'metadata': metadata
-            })
+            for r in records
+        ]
         
         return chunks
     
@@ -135,43 +250,111 @@ class RAGChatbot:
         try:
             # Check if collection exists
             try:
-                self.collection = self.chroma_client.get_collection(name=self.collection_name)
+                # Embeddings always come from self.embedder, so Chroma needs no embedding function
+                self.collection = self.chroma_client.get_collection(
+                    name=self.collection_name,
+                    embedding_function=None
+                )
                 logger.info(f"Loaded existing collection: {self.collection_name}")
             except:
                 # Create new collection
                 self.collection = self.chroma_client.create_collection(
                     name=self.collection_name,
-                    metadata={"description": "CRM customer insights and data"}
+                    metadata={"description": "CRM customer insights and data", "hnsw:space": "cosine"},
+                    embedding_function=None
                 )
                 logger.info(f"Created new collection: {self.collection_name}")
                 
                 # Add documents to the collection
                 self._populate_collection()
+                self._write_manifest()
+                return
+            
+            # Warm start: the CSV is unchanged since the collection was last synced
+            manifest = self._read_manifest()
+            if (manifest.get('csv_mtime') == self._csv_mtime()
+                    and manifest.get('row_count') == self.collection.count()):
+                logger.info("Collection is up to date with the data file")
+                return
+            
+            # Only embed rows that are new or whose text changed since the last sync
+            existing = self.collection.get(include=['documents'])
+            existing_docs = dict(zip(existing['ids'], existing['documents']))
+            self._populate_collection(existing_docs)
+            self._write_manifest()
         except Exception as e:
             logger.error(f"Failed to initialize vector database: {e}")
             raise
     
-    def _populate_collection(self):
-        """Populate the ChromaDB collection with customer data."""
+    def _manifest_path(self) -> str:
+        return os.path.join(self.chroma_db_path, 'manifest.json')
+    
+    def _csv_mtime(self) -> float:
+        return os.stat(self.data_file_path).st_mtime
+    
+    def _read_manifest(self) -> Dict[str, Any]:
+        """Read the sync manifest stored next to the collection, or {} if missing."""
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def _write_manifest(self):
+        """Record the data file state the collection was last synced with."""
+        try:
+            with open(self._manifest_path(), 'w') as f:
+                json.dump({'row_count': len(self.df), 'csv_mtime': self._csv_mtime()}, f)
+        except OSError as e:
+            logger.warning(f"Could not write collection manifest: {e}")
+    
+    def _populate_collection(self, existing_docs: Optional[Dict[str, str]] = None):
+        """
+        Populate the ChromaDB collection with customer data.
+        
+        Args:
+            existing_docs: Documents already in the collection, keyed by id. Chunks whose
+                text matches are not re-embedded and ids no longer in the data are deleted.
+        """
         try:
             chunks = self._create_document_chunks()
             
+            if existing_docs:
+                stale_ids = set(existing_docs) - {chunk['id'] for chunk in chunks}
+                if stale_ids:
+                    self.collection.delete(ids=list(stale_ids))
+                chunks = [chunk for chunk in chunks if existing_docs.get(chunk['id']) != chunk['text']]
+                if not chunks:
+                    logger.info("Collection already contains every document")
+                    return
+            
             # Prepare data for ChromaDB
             documents = [chunk['text'] for chunk in chunks]
             metadatas = [chunk['metadata'] for chunk in chunks]
             ids = [chunk['id'] for chunk in chunks]
             
+            # Embed all documents in one batched encoder call instead of per add()
+            embeddings = self.embedder.encode(
+                documents,
+                batch_size=min(64, max(len(documents), 1)),
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            ).tolist()
+            
             # Add to collection in batches to avoid memory issues
             batch_size = 100
             for i in range(0, len(documents), batch_size):
                 batch_docs = documents[i:i+batch_size]
                 batch_metadatas = metadatas[i:i+batch_size]
                 batch_ids = ids[i:i+batch_size]
+                batch_embeddings = embeddings[i:i+batch_size]
                 
-                self.collection.add(
+                self.collection.upsert(
                     documents=batch_docs,
                     metadatas=batch_metadatas,
-                    ids=batch_ids
+                    ids=batch_ids,
+                    embeddings=batch_embeddings
                 )
             
             logger.info(f"Successfully populated collection with {len(documents)} documents")
@@ -179,6 +362,16 @@ class RAGChatbot:
             logger.error(f"Failed to populate collection: {e}")
             raise
     
+    def _encode_query(self, query: str) -> np.ndarray:
+        vector = self.embedder.encode([query], normalize_embeddings=True)[0].astype(np.float32)
+        # Cached and shared between callers, so it must not be modified in place
+        vector.setflags(write=False)
+        return vector
+    
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a query with the sentence transformer (L2-normalized float32 vector, read-only)."""
+        return self._cached_query_embedding(query)
+    
     def _retrieve_relevant_documents(self, query: str, n_results: int = 5) -> List[Dict[str, Any]]:
         """
         Retrieve relevant documents from ChromaDB based on the query.
@@ -191,8 +384,9 @@ class RAGChatbot:
             List of relevant documents with metadata
         """
         try:
+            # Embed with the same model as the stored documents instead of Chroma's default function
             results = self.collection.query(
-                query_texts=[query],
+                query_embeddings=[self.embed_query(query).tolist()],
                 n_results=n_results
             )
             
@@ -223,25 +417,9 @@ class RAGChatbot:
             Generated response
         """
         try:
-            # Prepare context from retrieved documents
-            context_text = "\n\n".join([doc['text'] for doc in context_docs])
-            
-            # Create prompt for Gemini
-            prompt = f"""
-            You are an AI assistant specialized in Customer Relationship Management (CRM) insights. 
-            You have access to customer data and should provide helpful, accurate responses based on the context provided.
-            
-            Context from CRM database:
-            {context_text}
-            
-            User Query: {query}
-            
-            Please provide a helpful response based on the context above. If the query is about specific customers, 
-            use the provided data. If it's a general question about CRM insights, provide analysis based on the data.
-            Be conversational but professional, and include relevant metrics when appropriate.
-            
-            Response:
-            """
+            # Join the retrieved documents, capped so the prompt stays short
+            context_text = "\n\n".join(doc['text'] for doc in context_docs)[:self.MAX_CONTEXT_CHARS]
+            prompt = self.PROMPT_TEMPLATE.format(context=context_text, query=query)
             
             # Generate response using Gemini
             response = self.model.generate_content(prompt)
@@ -288,16 +466,15 @@ class RAGChatbot:
             Dictionary with customer insights
         """
         try:
-            # Query for specific customer
-            results = self.collection.query(
-                query_texts=[f"customer {customer_id}"],
-                n_results=1,
-                where={"customer_id": customer_id}
+            # Exact lookup by document id; no embedding or similarity search needed
+            results = self.collection.get(
+                ids=[f"customer_{customer_id}"],
+                include=['documents', 'metadatas']
             )
             
-            if results['documents'] and results['documents'][0]:
-                doc = results['documents'][0][0]
-                metadata = results['metadatas'][0][0] if results['metadatas'] else {}
+            if results['ids']:
+                doc = results['documents'][0]
+                metadata = results['metadatas'][0] if results['metadatas'] else {}
                 
                 return {
                     'customer_data': doc,
@@ -323,23 +500,27 @@ class RAGChatbot:
         """
         try:
             if segment:
-                # Query for specific segment
-                results = self.collection.query(
-                    query_texts=[f"segment {segment}"],
-                    n_results=10,
-                    where={"segment": segment}
+                # Plain metadata filter for a specific segment
+                results = self.collection.get(
+                    where={"segment": segment},
+                    limit=10,
+                    include=['documents', 'metadatas']
                 )
+                documents = results['documents']
+                metadatas = results['metadatas'] or []
             else:
                 # Get all segments
                 results = self.collection.query(
-                    query_texts=["customer segments analysis"],
+                    query_embeddings=[self.embed_query("customer segments analysis").tolist()],
                     n_results=50
                 )
+                documents = results['documents'][0] if results['documents'] else []
+                metadatas = results['metadatas'][0] if results['metadatas'] else []
             
-            if results['documents'] and results['documents'][0]:
+            if documents:
                 return {
-                    'documents': results['documents'][0],
-                    'metadatas': results['metadatas'][0] if results['metadatas'] else [],
+                    'documents': documents,
+                    'metadatas': metadatas,
                     'found': True
                 }
             else:
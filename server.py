@@ -2,31 +2,130 @@
 Flask backend providing:
 - index page
 - /api/summary --> overall counts, top risk, upsell
-- /api/segment/<segment> --> customers in selected segment
+- /api/segment/<segment> --> customers in selected segment (top 200 by churn, ?limit=N for more; large lists are streamed)
 - /api/upsell --> upsell candidates
+  (both also answer with an Arrow IPC stream for "Accept: application/vnd.apache.arrow.stream")
 - /api/info --> foundational info for mini web page
 - /api/chat --> chatbot endpoint (POST {"query": "..."} )
 """
 
 import os
-from flask import Flask, render_template, jsonify, request
+import io
+import gzip
+import hashlib
+import importlib.util
+from datetime import date
+from functools import lru_cache
+import orjson
+from flask import Flask, Response, render_template, request
+from werkzeug.http import http_date
+import numpy as np
 import pandas as pd
 from chatbot import handle_query
-from insights import recommend_upsell
+from customer_data import parquet_path, read_processed
+from insights import CustomerSoA, recommend_upsell_vec
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_FOLDER = os.path.join(BASE_DIR, "templates")
 STATIC_FOLDER = os.path.join(BASE_DIR, "static")
 DATA_FILE = os.path.join(BASE_DIR, "data", "processed_customers.csv")
+PARQUET_FILE = parquet_path(DATA_FILE)
 
 app = Flask(__name__, template_folder=TEMPLATE_FOLDER, static_folder=STATIC_FOLDER)
 
+# columns returned by each endpoint
+TOPRISK_COLS = ["customer_id", "company_name", "segment", "churn_prob", "last_interaction_date"]
+UPSELL_COLS = ["customer_id", "company_name", "monetary", "product_diversity", "churn_prob"]
+SEGMENT_COLS = ["customer_id", "company_name", "segment", "churn_prob", "monetary", "product_diversity", "engagement_score", "last_interaction_date"]
+
+SEGMENT_LIMIT = 200  # rows per /api/segment response unless ?limit= asks for another number
+STREAM_CHUNK_ROWS = 500
+
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+def _json_default(obj):
+    # dates keep the HTTP-date format jsonify used; NaT becomes null
+    if obj is pd.NaT:
+        return None
+    if isinstance(obj, date):
+        return http_date(obj)
+    raise TypeError
+
+
+def ojson_bytes(obj):
+    """Serialize obj with orjson (sorted keys, numpy values allowed)."""
+    return orjson.dumps(
+        obj,
+        default=_json_default,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS
+    )
+
+
+def ojson(obj, status=200):
+    """JSON response built with orjson instead of jsonify."""
+    return Response(ojson_bytes(obj), status=status, mimetype="application/json")
+
+
+def _py_values(values):
+    """Array slice as Python values; datetime64 goes through microseconds so it becomes datetime (NaT -> None)."""
+    if values.dtype.kind == "M":
+        values = values.astype("datetime64[us]")
+    return values.tolist()
+
+
+def records(pos, cols):
+    """Rows of df at positions pos as a list of dicts, read straight from the COLUMNS arrays."""
+    return [dict(zip(cols, row)) for row in zip(*(_py_values(COLUMNS[c][pos]) for c in cols))]
+
+
+def stream_records(pos, cols, chunk=STREAM_CHUNK_ROWS):
+    """Yield the rows at positions pos as one JSON array, serialized chunk rows at a time instead of buffered."""
+    yield b"["
+    for start in range(0, len(pos), chunk):
+        body = ojson_bytes(records(pos[start:start + chunk], cols))[1:-1]
+        yield b"," + body if start else body
+    yield b"]"
+
+
+def wants_arrow():
+    """True if the client prefers an Arrow IPC stream over JSON (and pyarrow is installed)."""
+    return HAS_PYARROW and request.accept_mimetypes.best_match(["application/json", ARROW_MIMETYPE]) == ARROW_MIMETYPE
+
+
+def arrow_response(frame):
+    """Serialize a DataFrame as an Arrow IPC stream, column by column with no per-row dicts."""
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    sink = io.BytesIO()
+    with ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return Response(sink.getvalue(), mimetype=ARROW_MIMETYPE)
+
+
+def top_k_positions(values, k, mask=None):
+    """
+    Row positions of the k largest values (only where mask is True), largest first.
+    Equal values keep row order like DataFrame.nlargest; NaNs are skipped.
+    """
+    cand = np.flatnonzero(mask) if mask is not None else np.arange(len(values))
+    cand = cand[~np.isnan(values[cand])]
+    v = values[cand]
+    if len(v) > k:
+        # partial selection: everything at least as large as the k-th largest (ties included)
+        kth = np.partition(v, len(v) - k)[len(v) - k]
+        keep = np.flatnonzero(v >= kth)
+        cand, v = cand[keep], v[keep]
+    return cand[np.lexsort((cand, -v))[:k]]
+
 
 def load_dataframe():
     """Load preprocessed customer data. Ensure required columns exist or add defaults."""
-    if not os.path.exists(DATA_FILE):
+    if not os.path.exists(DATA_FILE) and not os.path.exists(PARQUET_FILE):
         raise SystemExit(f"Missing data file: {DATA_FILE}. Run your training script (ml_models.py) first.")
-    df = pd.read_csv(DATA_FILE, parse_dates=["signup_date", "last_interaction_date"], low_memory=False)
+    df = read_processed(DATA_FILE)
     for col, default in [
         ("customer_id", ""), ("company_name", ""),
         ("segment", "unknown"), ("churn_prob", 0.0),
@@ -35,10 +134,87 @@ def load_dataframe():
     ]:
         if col not in df.columns:
             df[col] = default
+    # smallest integer dtypes for the scanned columns; floats stay float64 so values serialize unchanged
+    for col in ["product_diversity", "recency_days", "monetary", "engagement_score"]:
+        if pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+    df["segment"] = df["segment"].astype("category")
+    # lowercase segment as a categorical so lookups compare int codes, not strings
+    df["segment_lc"] = df["segment"].str.lower().astype("category")
     return df
 
 # Load into global df for simplicity
 df = load_dataframe()
+# struct-of-arrays view of the served columns for the JSON paths: one NumPy array per column, indexed
+# by row position. Arrays keep their native dtypes (dates stay datetime64) and are converted per slice
+COLUMNS = {c: df[c].to_numpy() for c in dict.fromkeys([*TOPRISK_COLS, *UPSELL_COLS, *SEGMENT_COLS])}
+
+# df is never mutated after load, so the upsell candidates and the summary payload are built once
+# the upsell rule is evaluated once, on segment codes
+_upsell_mask = CustomerSoA(df).upsell_mask()
+# top 50 is all /api/upsell ever shows (and the summary shows the first 10 of those)
+_upsell_pos = top_k_positions(df["monetary"].to_numpy(dtype=float), 50, _upsell_mask)
+# rows are taken from column-pruned frames, so per-request slices only copy the columns that are sent
+_upsell_sorted = df[UPSELL_COLS].iloc[_upsell_pos]
+_upsell_records = records(_upsell_pos, UPSELL_COLS)
+# offers are drawn once per process (like the chatbot's upsell view), so /api/upsell is fixed too
+_upsell_recs = recommend_upsell_vec(df.iloc[_upsell_pos]).tolist()
+_upsell_json = ojson_bytes([{**r, "recommendation": rec} for r, rec in zip(_upsell_records, _upsell_recs)])
+_SEGMENT_FRAME = df[SEGMENT_COLS]
+# row positions by descending churn_prob (ties in file order), overall and per lowercase segment;
+# top-k churn queries become slices of these
+_CHURN_ORDER = np.argsort(-df["churn_prob"].to_numpy(), kind="stable")
+_seg_codes = df["segment_lc"].cat.codes.to_numpy()[_CHURN_ORDER]
+_SEG_CHURN_ORDER = {
+    seg: _CHURN_ORDER[_seg_codes == code] for code, seg in enumerate(df["segment_lc"].cat.categories)
+}
+_SEG_COUNTS = df["segment"].value_counts().to_dict()
+_VALID_SEGMENTS = frozenset(_SEG_CHURN_ORDER)
+
+
+def build_summary():
+    top_risk = records(_CHURN_ORDER[:10], TOPRISK_COLS)
+    upsell = _upsell_records[:10]
+    return {"segments": _SEG_COUNTS, "top_risk": top_risk, "upsell": upsell}
+
+
+_summary_json = ojson_bytes(build_summary())
+
+INFO = {
+    "title": "AI-Powered CRM Insights - Hackathon Demo",
+    "subtitle": "Quickly find at-risk accounts, upsell targets, and conversational insights.",
+    "contact": {
+        "name": "Parkavi. S",
+        "email": "parkavisaravanan06@gmail.com"
+    },
+    "notes": [
+        "Data shown is mock/simulated. Replace with real CRM export for production.",
+        "Models: KMeans for segmentation, RandomForest for churn probability (demo).",
+        "Designed to help sales teams prioritize high-risk accounts and identify upsell opportunities.",
+        "Interactive dashboard allows filtering by region, account size, and risk category.",
+        "Built with Python (Flask backend), JavaScript (frontend interactivity), and Bootstrap for responsive design.",
+        "Future improvements: integrate real-time CRM data, advanced NLP for conversation insights, and predictive revenue forecasting."
+    ],
+    "features": [
+        "At-risk account identification with churn probability visualization",
+        "Upsell candidate recommendations based on customer segmentation",
+        "Interactive pie charts, tables, and filters for easy data exploration",
+        "Exportable insights for team reporting",
+        "Clean and responsive UI suitable for desktop and mobile"
+    ],
+    "tech_stack": [
+        "Python (Flask) - backend API and data processing",
+        "JavaScript (D3.js/Chart.js) - interactive charts",
+        "Bootstrap 5 - responsive design",
+        "scikit-learn - machine learning models (KMeans, RandomForest)",
+        "Pandas/Numpy - data manipulation"
+    ]
+}
+_info_json = ojson_bytes(INFO)
+# /api/info is constant: keep a gzipped copy and an ETag per encoding so clients can revalidate with a 304
+_info_gz = gzip.compress(_info_json, mtime=0)
+_info_etag = hashlib.sha1(_info_json).hexdigest()
+_info_gz_etag = _info_etag + "-gz"
 
 
 @app.route("/")
@@ -48,76 +224,61 @@ def index():
 
 @app.route("/api/summary")
 def api_summary():
-    seg_counts = df["segment"].value_counts().to_dict()
-    top_risk = df.sort_values("churn_prob", ascending=False).head(10)[
-        ["customer_id", "company_name", "segment", "churn_prob", "last_interaction_date"]
-    ].to_dict(orient="records")
-    upsell = df[
-        (df["segment"] == "high_value") & (df["churn_prob"] < 0.4) & (df["product_diversity"] <= 2)
-    ].sort_values("monetary", ascending=False).head(10)[
-        ["customer_id", "company_name", "monetary", "product_diversity", "churn_prob"]
-    ].to_dict(orient="records")
-    return jsonify({"segments": seg_counts, "top_risk": top_risk, "upsell": upsell})
+    return Response(_summary_json, mimetype="application/json")
+
+
+def segment_rows(seg, limit=SEGMENT_LIMIT):
+    """Top customers of a lowercase segment by churn probability (SEGMENT_COLS only)."""
+    return _SEGMENT_FRAME.iloc[_SEG_CHURN_ORDER[seg][:limit]]
+
+
+@lru_cache(maxsize=32)
+def _segment_payload(seg):
+    # serialized JSON for a known lowercase segment at the default limit
+    return ojson_bytes(records(_SEG_CHURN_ORDER[seg][:SEGMENT_LIMIT], SEGMENT_COLS))
 
 
 @app.route("/api/segment/<segment>")
 def api_segment(segment):
     seg = segment.lower()
-    rows = df[df["segment"].str.lower() == seg].sort_values("churn_prob", ascending=False)
-    if rows.empty:
-        return jsonify({"error": f"No customers found for segment: {segment}"}), 404
-    out = rows[
-        ["customer_id", "company_name", "segment", "churn_prob", "monetary", "product_diversity", "engagement_score", "last_interaction_date"]
-    ].head(200).to_dict(orient="records")
-    return jsonify(out)
+    # reject unknown names up front so they never reach the dataframe or evict cached payloads
+    if seg not in _VALID_SEGMENTS:
+        return ojson({"error": f"No customers found for segment: {segment}"}, status=404)
+    limit = request.args.get("limit", str(SEGMENT_LIMIT))
+    if not (limit.isascii() and limit.isdigit()):
+        return ojson({"error": f"limit must be a non-negative integer, got: {limit}"}, status=400)
+    limit = int(limit)
+    if wants_arrow():
+        return arrow_response(segment_rows(seg, limit))
+    if limit == SEGMENT_LIMIT:
+        return Response(_segment_payload(seg), mimetype="application/json")
+    # other sizes (up to the whole segment) are sent chunk by chunk as they are serialized
+    return Response(stream_records(_SEG_CHURN_ORDER[seg][:limit], SEGMENT_COLS), mimetype="application/json")
 
 
 @app.route("/api/upsell")
 def api_upsell():
-    ups = df[
-        (df["segment"] == "high_value") & (df["churn_prob"] < 0.4) & (df["product_diversity"] <= 2)
-    ].sort_values("monetary", ascending=False).head(50)[
-        ["customer_id", "company_name", "monetary", "product_diversity", "churn_prob"]
-    ]
-    arr = ups.to_dict(orient="records")
-    for r in arr:
-        r["recommendation"] = recommend_upsell(r)
-    return jsonify(arr)
+    # _upsell_sorted is already capped at 50 rows
+    if wants_arrow():
+        return arrow_response(_upsell_sorted.assign(recommendation=_upsell_recs))
+    return Response(_upsell_json, mimetype="application/json")
 
 
 @app.route("/api/info")
 def api_info():
-    info = {
-        "title": "AI-Powered CRM Insights - Hackathon Demo",
-        "subtitle": "Quickly find at-risk accounts, upsell targets, and conversational insights.",
-        "contact": {
-            "name": "Parkavi. S",
-            "email": "parkavisaravanan06@gmail.com"
-        },
-        "notes": [
-            "Data shown is mock/simulated. Replace with real CRM export for production.",
-            "Models: KMeans for segmentation, RandomForest for churn probability (demo).",
-            "Designed to help sales teams prioritize high-risk accounts and identify upsell opportunities.",
-            "Interactive dashboard allows filtering by region, account size, and risk category.",
-            "Built with Python (Flask backend), JavaScript (frontend interactivity), and Bootstrap for responsive design.",
-            "Future improvements: integrate real-time CRM data, advanced NLP for conversation insights, and predictive revenue forecasting."
-        ],
-        "features": [
-            "At-risk account identification with churn probability visualization",
-            "Upsell candidate recommendations based on customer segmentation",
-            "Interactive pie charts, tables, and filters for easy data exploration",
-            "Exportable insights for team reporting",
-            "Clean and responsive UI suitable for desktop and mobile"
-        ],
-        "tech_stack": [
-            "Python (Flask) - backend API and data processing",
-            "JavaScript (D3.js/Chart.js) - interactive charts",
-            "Bootstrap 5 - responsive design",
-            "scikit-learn - machine learning models (KMeans, RandomForest)",
-            "Pandas/Numpy - data manipulation"
-        ]
-    }
-    return jsonify(info)
+    headers = {"Cache-Control": "public, max-age=3600", "Vary": "Accept-Encoding"}
+    # strong validators are byte-exact, so the gzip and identity bodies carry different tags
+    if request.accept_encodings["gzip"] > 0:  # "gzip;q=0" means the client refuses it
+        etag, body = _info_gz_etag, _info_gz
+        headers["Content-Encoding"] = "gzip"
+    else:
+        etag, body = _info_etag, _info_json
+    if etag in request.if_none_match:
+        resp = Response(status=304, headers={k: v for k, v in headers.items() if k != "Content-Encoding"})
+    else:
+        resp = Response(body, mimetype="application/json", headers=headers)
+    resp.set_etag(etag)
+    return resp
 
 
 @app.route("/api/chat", methods=["POST"])
@@ -136,8 +297,9 @@ def api_chat():
         else:
             response_text = str(ans)
             context = {}
-    return jsonify({"answer": response_text, "context": context})
+    return ojson({"answer": response_text, "context": context})
 
 
 if __name__ == "__main__":
-    app.run(debug=True, host="127.0.0.1", port=5000)
+    # development server only; the debugger/reloader is opt-in with DEV=1 (production: gunicorn wsgi:app)
+    app.run(debug=os.getenv("DEV", "").lower() in ("1", "true", "yes"), host="127.0.0.1", port=5000)
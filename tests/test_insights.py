@@ -0,0 +1,16 @@
+import pandas as pd
+
+from insights import customer_insight, customer_insights_vec
+
+
+def test_customer_insights_vec_matches_customer_insight():
+    df = pd.DataFrame({
+        "customer_id": [1, 2, 3, 4],
+        "company_name": ["Acme", "Globex", "Initech", "Umbrella"],
+        "segment": ["at_risk", "high_value", "mid_value", "at_risk"],
+        "churn_prob": [0.91, 0.12, 0.61, 0.6],
+        "engagement_score": [0.2, 0.8, 0.35, 0.1],
+        "recency_days": [120, 10, 91, 90],
+        "last_interaction_date": pd.to_datetime(["2025-05-16", "2025-07-01", None, "2025-01-02"]),
+    })
+    assert customer_insights_vec(df) == [customer_insight(row) for _, row in df.iterrows()]
@@ -0,0 +1,34 @@
+import numpy as np
+
+from rag_chatbot import SemanticCache
+
+
+def _unit(i, dim=4):
+    v = np.zeros(dim, dtype=np.float32)
+    v[i] = 1.0
+    return v
+
+
+def test_semantic_cache_hit_and_miss():
+    cache = SemanticCache()
+    cache.put(_unit(0), "first")
+    assert cache.get(_unit(0)) == "first"
+    assert cache.get(_unit(1)) is None
+
+
+def test_semantic_cache_single_entry_evicts():
+    cache = SemanticCache(max_entries=1)
+    cache.put(_unit(0), "first")
+    cache.put(_unit(1), "second")
+    assert len(cache._responses) == len(cache._timestamps) == len(cache._vectors) == 1
+    assert cache.get(_unit(0)) is None
+    assert cache.get(_unit(1)) == "second"
+
+
+def test_semantic_cache_keeps_newest_entries():
+    cache = SemanticCache(max_entries=2)
+    for i, text in enumerate(["a", "b", "c"]):
+        cache.put(_unit(i), text)
+    assert cache._responses == ["b", "c"]
+    assert cache.get(_unit(0)) is None
+    assert cache.get(_unit(2)) == "c"
@@ -0,0 +1,38 @@
+import gzip
+
+import pytest
+
+import server
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+def test_info_gzip_when_accepted(client):
+    resp = client.get("/api/info", headers={"Accept-Encoding": "gzip"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(resp.data) == server._info_json
+    assert resp.get_etag()[0] == server._info_gz_etag
+
+
+def test_info_identity_when_gzip_refused(client):
+    resp = client.get("/api/info", headers={"Accept-Encoding": "gzip;q=0, identity"})
+    assert "Content-Encoding" not in resp.headers
+    assert resp.data == server._info_json
+    assert resp.get_etag()[0] == server._info_etag
+
+
+def test_segment_limit(client):
+    default = client.get("/api/segment/at_risk").get_json()
+    resp = client.get("/api/segment/at_risk?limit=5")
+    assert resp.status_code == 200
+    assert resp.get_json() == default[:5]
+
+
+@pytest.mark.parametrize("limit", ["-5", "abc", "", "1.5"])
+def test_segment_rejects_bad_limit(client, limit):
+    resp = client.get(f"/api/segment/at_risk?limit={limit}")
+    assert resp.status_code == 400
+    assert "limit" in resp.get_json()["error"]
@@ -0,0 +1,9 @@
+"""
+WSGI entry point for production servers, e.g.
+
+    gunicorn -w 4 -k gthread --threads 4 --preload -b 127.0.0.1:5000 wsgi:app
+
+--preload loads the customer data once in the master process so forked workers share it.
+"""
+
+from server import app